@@ -0,0 +1,182 @@
+#-*-coding:utf8;-*-
+from collections import deque
+from string import ascii_letters
+
+from nonograms import NonogramImpossible, block_length, block_colour, needs_separator
+from nonogram_solver import generate_blocks
+
+
+# Coloured nonograms. Each cell is a single int used as a bitmask of what it could still be:
+# bit 0 is empty and bit n is the nth colour. A cell is decided once only one bit is left.
+# Lines are solved exactly by working out every way the blocks can fit (see line_options),
+# which copes with blocks of different colours touching without any special rules.
+
+EMPTY_BIT = 1
+
+
+def prefix_placements(lengths, colour_bits, cells):
+    # fits[j][i]: the first j blocks fit in cells[:i]
+    # gap[j][i]: the first j blocks fit in cells[:i] with cells[i-1] empty (or nothing there at all)
+    size = len(cells)
+    allows = {}
+    for bit in set(colour_bits) | {EMPTY_BIT}:
+        # allows[bit][i] counts the cells before i that can be this colour, so ranges can be checked in one go
+        counts = [0]
+        for cell in cells:
+            counts.append(counts[-1] + bool(cell & bit))
+        allows[bit] = counts
+    empty_allowed = allows[EMPTY_BIT]
+
+    fits = [[False] * (size + 1) for _ in xrange(len(lengths) + 1)]
+    gap = [[False] * (size + 1) for _ in xrange(len(lengths) + 1)]
+    fits[0][0] = gap[0][0] = True
+    for i in xrange(1, size + 1):
+        fits[0][i] = gap[0][i] = empty_allowed[i] == i
+    for j in xrange(1, len(lengths) + 1):
+        length, bit = lengths[j - 1], colour_bits[j - 1]
+        same_colour_before = j > 1 and colour_bits[j - 2] == bit
+        for i in xrange(1, size + 1):
+            gap[j][i] = fits[j][i - 1] and cells[i - 1] & EMPTY_BIT
+            start = i - length
+            ends_here = (
+                start >= 0 and allows[bit][i] - allows[bit][start] == length and
+                (gap if same_colour_before else fits)[j - 1][start]
+            )
+            fits[j][i] = bool(gap[j][i] or ends_here)
+            gap[j][i] = bool(gap[j][i])
+    return fits, gap, allows
+
+
+def line_options(values, colour_bits, cells):
+    # What each cell could be, given the clue and what is known about the line already.
+    lengths = [block_length(value) for value in values if block_length(value)]
+    bits = [colour_bits[block_colour(value)] for value in values if block_length(value)]
+    size = len(cells)
+    blocks = len(lengths)
+
+    fits, gap, allows = prefix_placements(lengths, bits, cells)
+    if not fits[blocks][size]:
+        raise NonogramImpossible("No way to fit {} into this line".format(values))
+    # the same thing from the other end tells us about the blocks after each point
+    fits_after, gap_after, _ = prefix_placements(lengths[::-1], bits[::-1], cells[::-1])
+
+    options = [0] * size
+    for i in xrange(size):
+        if cells[i] & EMPTY_BIT and any(
+            fits[j][i] and fits_after[blocks - j][size - i - 1] for j in xrange(blocks + 1)
+        ):
+            options[i] |= EMPTY_BIT
+
+    for j in xrange(blocks):
+        length, bit = lengths[j], bits[j]
+        before = gap if j and bits[j - 1] == bit else fits
+        after = gap_after if j < blocks - 1 and bits[j + 1] == bit else fits_after
+        covered = [0] * (size + 1)
+        for start in xrange(size - length + 1):
+            end = start + length
+            if (
+                allows[bit][end] - allows[bit][start] == length and
+                before[j][start] and after[blocks - j - 1][size - end]
+            ):
+                covered[start] += 1
+                covered[end] -= 1
+        running = 0
+        for i in xrange(size):
+            running += covered[i]
+            if running:
+                options[i] |= bit
+    return options
+
+
+class ColourNonogramGrid(list):
+    # self[row][column] is the bitmask for that cell
+    def __init__(self, row_values, column_values):
+        super(ColourNonogramGrid, self).__init__()
+        self.rows = row_values
+        self.columns = column_values
+        self.size = {'row': len(self.columns), 'column': len(self.rows)}
+        self.colours = []
+        for values in row_values + column_values:
+            for value in values:
+                if block_colour(value) not in self.colours:
+                    self.colours.append(block_colour(value))
+        self.colour_bits = {colour: 2 << position for position, colour in enumerate(self.colours)}
+        # one character per colour for printing, from its name where possible. 'x' and '.' are taken.
+        self.colour_symbols = []
+        for colour in self.colours:
+            candidates = (colour or '0') + '0123456789' + ascii_letters
+            self.colour_symbols.append(next(
+                symbol for symbol in candidates if symbol not in 'x.' and symbol not in self.colour_symbols
+            ))
+        unknown = (2 << len(self.colours)) - 1
+        for _ in row_values:
+            self.append([unknown] * self.size['row'])
+        self.fill_exact_lines()
+
+    def get_line(self, direction, index):
+        if direction == 'row':
+            return list(self[index])
+        return [row[index] for row in self]
+
+    def set_line(self, direction, index, cells):
+        # returns the indices of the crossing lines that changed
+        changed = []
+        for position, cell in enumerate(cells):
+            row, column = (index, position) if direction == 'row' else (position, index)
+            if self[row][column] != cell:
+                if not cell:
+                    raise NonogramImpossible("Cell {},{} can't be anything".format(column, row))
+                self[row][column] = cell
+                changed.append(position)
+        return changed
+
+    def fill_exact_lines(self):
+        # lines whose blocks exactly fill them can be written straight in before doing anything clever
+        for direction, clues in [('row', self.rows), ('column', self.columns)]:
+            for index, values in enumerate(clues):
+                values = [value for value in values if block_length(value)]
+                gaps = sum(needs_separator(value, next_value) for value, next_value in zip(values, values[1:]))
+                if sum(block_length(value) for value in values) + gaps == self.size[direction]:
+                    cells = self.get_line(direction, index)
+                    exact = [
+                        cell & (EMPTY_BIT if value == 'gap' else self.colour_bits[block_colour(value)])
+                        for cell, value in zip(cells, generate_blocks(values, separator='gap'))
+                    ]
+                    self.set_line(direction, index, exact)
+
+    def solve(self):
+        # Keep solving lines until nothing changes. Only lines crossing a changed cell get looked at again.
+        # Returns how many lines were solved along the way.
+        other = {'row': 'column', 'column': 'row'}
+        to_do = deque([('row', index) for index in xrange(self.size['column'])])
+        to_do.extend([('column', index) for index in xrange(self.size['row'])])
+        waiting = set(to_do)
+        lines_solved = 0
+        while to_do:
+            direction, index = to_do.popleft()
+            waiting.discard((direction, index))
+            clues = self.rows if direction == 'row' else self.columns
+            cells = self.get_line(direction, index)
+            options = line_options(clues[index], self.colour_bits, cells)
+            lines_solved += 1
+            for position in self.set_line(direction, index, [cell & option for cell, option in zip(cells, options)]):
+                if (other[direction], position) not in waiting:
+                    waiting.add((other[direction], position))
+                    to_do.append((other[direction], position))
+        return lines_solved
+
+    def completed(self):
+        return all(cell & (cell - 1) == 0 for row in self for cell in row)
+
+    def cell_string(self, cell):
+        if cell == EMPTY_BIT:
+            return 'x'
+        if cell & (cell - 1):
+            return '.'
+        return self.colour_symbols[cell.bit_length() - 2]
+
+    def __str__(self):
+        return '\n'.join(' '.join(self.cell_string(cell) for cell in row) for row in self)
+
+    def __unicode__(self):
+        return unicode(str(self))
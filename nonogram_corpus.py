@@ -0,0 +1,110 @@
+import mmap
+import struct
+import sys
+
+from nonograms import nonograms_input_reader, is_coloured, NonogramBadRequest
+
+
+# Binary corpus of puzzles so workers can pull out puzzle n without parsing any of the others.
+#
+# header: magic, format version, number of puzzles, where the index starts
+# puzzles: number of rows, number of columns, how many values in each row then each column, then all the values
+# index: where each puzzle starts, plus one more entry for where the last one ends
+# Everything is little endian unsigned 16 bit apart from the header counts and the index which are wider.
+
+MAGIC = 'NONOGRAM'
+VERSION = 1
+HEADER = struct.Struct('<8sH2xIQ')
+INDEX_ENTRY = struct.Struct('<Q')
+PUZZLE_SIZE = struct.Struct('<HH')
+MAX_VALUE = 0xffff
+
+
+def pack_puzzle(rows, columns):
+    if is_coloured({'rows': rows, 'columns': columns}):
+        raise NonogramBadRequest("The corpus format only stores monochrome puzzles")
+    lines = rows + columns
+    values = [value for line in lines for value in line]
+    if len(rows) > MAX_VALUE or len(columns) > MAX_VALUE or any(value > MAX_VALUE for value in values):
+        raise NonogramBadRequest("This puzzle is too big to store in a corpus")
+    return (
+        PUZZLE_SIZE.pack(len(rows), len(columns)) +
+        struct.pack('<{}H'.format(len(lines)), *[len(line) for line in lines]) +
+        struct.pack('<{}H'.format(len(values)), *values)
+    )
+
+
+def build_corpus(filename, puzzles):
+    # puzzles are dicts like nonograms_input_reader gives back, with 'rows' and 'columns'
+    offsets = []
+    with open(filename, 'wb') as handler:
+        handler.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        for puzzle in puzzles:
+            offsets.append(handler.tell())
+            handler.write(pack_puzzle(puzzle['rows'], puzzle['columns']))
+        offsets.append(handler.tell())
+        index_offset = handler.tell()
+        for offset in offsets:
+            handler.write(INDEX_ENTRY.pack(offset))
+        handler.seek(0)
+        handler.write(HEADER.pack(MAGIC, VERSION, len(offsets) - 1, index_offset))
+    return len(offsets) - 1
+
+
+def build_corpus_from_text(filename, text_filenames):
+    return build_corpus(filename, (nonograms_input_reader(text_filename) for text_filename in text_filenames))
+
+
+class NonogramCorpus(object):
+    # Memory maps a corpus file. corpus[n] only reads the bytes for puzzle n.
+    def __init__(self, filename):
+        self.handler = open(filename, 'rb')
+        self.data = mmap.mmap(self.handler.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.index_offset = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise NonogramBadRequest("{} is not a nonogram corpus".format(filename))
+        if version != VERSION:
+            raise NonogramBadRequest("Don't know how to read version {} of the corpus format".format(version))
+
+    def __len__(self):
+        return self.count
+
+    def puzzle_offset(self, index):
+        if not -self.count <= index < self.count:
+            raise IndexError("There are only {} puzzles in this corpus".format(self.count))
+        return INDEX_ENTRY.unpack_from(self.data, self.index_offset + INDEX_ENTRY.size * (index % self.count))[0]
+
+    def __getitem__(self, index):
+        offset = self.puzzle_offset(index)
+        row_count, column_count = PUZZLE_SIZE.unpack_from(self.data, offset)
+        offset += PUZZLE_SIZE.size
+        line_count = row_count + column_count
+        lengths = struct.unpack_from('<{}H'.format(line_count), self.data, offset)
+        offset += 2 * line_count
+        values = struct.unpack_from('<{}H'.format(sum(lengths)), self.data, offset)
+
+        lines = []
+        start = 0
+        for length in lengths:
+            lines.append(list(values[start:start + length]))
+            start += length
+        return {'rows': lines[:row_count], 'columns': lines[row_count:]}
+
+    def __iter__(self):
+        for index in xrange(self.count):
+            yield self[index]
+
+    def close(self):
+        self.data.close()
+        self.handler.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == '__main__':
+    # python nonogram_corpus.py corpus.bin nonograms_data.txt nonograms_data2.txt ...
+    print "Wrote {} puzzles".format(build_corpus_from_text(sys.argv[1], sys.argv[2:]))
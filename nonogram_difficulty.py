@@ -0,0 +1,136 @@
+from collections import defaultdict
+import sys
+
+from nonograms import nonograms_input_reader, NonogramImpossible
+from nonogram_output import grid_bitmap, bitmap_mistakes
+from nonogram_solver import NonogramSolver
+
+
+# Rates how hard a puzzle is to solve by hand from how much work the rules have to do.
+# Unlike tally_nonogram_rules_used this always runs the rules in the same order so one run is enough.
+
+# How much cleverness each rule needs, easiest first. This is also the order the rater tries them in.
+# A harder rule only gets used once the easier rules have stopped making progress anywhere in the grid,
+# and as soon as it does something it's back to the easy rules again.
+RULE_LEVELS = [
+    ('fill_fully_entire_line', 1),
+    ('fill_middle', 1),
+    ('got_enough_filled_or_not_filled', 1),
+    ('fill_block_if_it_touches_edge', 1),
+    ('fill_from_edge', 1),
+    ('next_to_known_empty', 1),
+    ('cross_out_too_far_from_any_block', 2),
+    ('rule_out_values_too_small_for_this_block', 2),
+    ('rule_out_values_based_on_already_used_up', 2),
+    ('remove_options_if_other_pieces_before_it', 2),
+    ('cross_out_too_far_from_known_value', 2),
+    ('block_long_enough', 2),
+    ('split_row_by_known_block', 3),
+    ('too_far_from_known_block_repeated_values', 3),
+    ('eliminate_wrong_side', 3),
+]
+# every rule the solver has needs a level, or the rater would rate a different solver
+assert sorted(rule for rule, level in RULE_LEVELS) == sorted(NonogramSolver.rules)
+# having to guess and backtrack is harder than any rule
+SEARCH_LEVEL = 5
+
+
+def try_easiest_rules_first(solver, direction, index, values, rules, rules_used):
+    # Work on one line, going back to the easiest rule every time something changes.
+    # Only counts a rule when the line really did change. Returns the level of the hardest rule that did anything.
+    hardest = 0
+    position = 0
+    while position < len(rules) and not solver.completed(direction, index):
+        rule, level = rules[position]
+        version = solver.line_versions[direction][index]
+        getattr(solver, rule).line_rule(solver, index, values, direction)
+        if solver.line_versions[direction][index] != version:
+            rules_used[rule] += 1
+            hardest = max(hardest, level)
+            position = 0
+        else:
+            position += 1
+    return hardest
+
+
+def rate_puzzle(rows, columns):
+    # The clue-only preprocessing is left off so the rules have to do (and get credit for) all the work
+    solver = NonogramSolver(rows, columns, preprocess=False)
+    levels = dict(RULE_LEVELS)
+    lines = [
+        (direction, index, values)
+        for direction, clues in [('row', solver.rows), ('column', solver.columns)]
+        for index, values in enumerate(clues)
+    ]
+
+    rules_used = defaultdict(int)
+    # the version of each line when the rules up to some level last got nowhere with it, no point trying again
+    stuck = {}
+    passes = 0
+    level_allowed = 1
+    while level_allowed <= max(levels.itervalues()):
+        rules = [(rule, level) for rule, level in RULE_LEVELS if level <= level_allowed]
+        hardest = 0
+        for direction, index, values in lines:
+            version = solver.line_versions[direction][index]
+            stuck_version, stuck_level = stuck.get((direction, index), (None, 0))
+            if stuck_version == version and stuck_level >= level_allowed:
+                continue
+            used = try_easiest_rules_first(solver, direction, index, values, rules, rules_used)
+            if not used:
+                stuck[(direction, index)] = (version, level_allowed)
+            hardest = max(hardest, used)
+            if hardest > 1:
+                # the harder rule got us going again, see how far the easy ones get from here
+                break
+        if hardest:
+            passes += 1
+            level_allowed = 1
+        else:
+            level_allowed += 1
+
+    tiles = solver.size['row'] * solver.size['column']
+    unknown = sum(not (tile.filled or any(tile.decided.itervalues())) for row in solver for tile in row)
+    level = max([levels[rule] for rule in rules_used] + [0])
+    difficulty = 10 * level + passes + 2 * len(rules_used)
+
+    sat_stats = None
+    if not solver.all_completed():
+        from nonogram_sat import solve_with_sat
+        sat_stats = solve_with_sat(solver)
+        level = SEARCH_LEVEL
+        # the more of the grid is left when the rules give up, and the more dead ends, the harder
+        difficulty += 10 * SEARCH_LEVEL + 50.0 * unknown / tiles + sat_stats['conflicts']
+    # same as NonogramSolver.solve, don't rate a grid the clues can't agree on
+    for direction, index in bitmap_mistakes(grid_bitmap(solver), solver.rows, solver.columns):
+        raise NonogramImpossible("The finished grid doesn't match the clue for {} {}".format(direction, index))
+
+    return {
+        'difficulty': round(difficulty, 1),
+        'level': level,
+        'passes': passes,
+        'rules': dict(rules_used),
+        'search': sat_stats is not None,
+        'unknown_after_rules': unknown,
+        'sat': sat_stats,
+    }
+
+
+def rate_corpus(puzzles):
+    # puzzles can be anything yielding {'rows': ..., 'columns': ...} e.g. a NonogramCorpus
+    # A puzzle that can't be rated gets an error in its place so the rest of the corpus still gets rated.
+    for puzzle in puzzles:
+        try:
+            yield rate_puzzle(puzzle['rows'], puzzle['columns'])
+        except Exception as error:
+            yield {'error': '{}: {}'.format(type(error).__name__, error)}
+
+
+if __name__ == '__main__':
+    # python nonogram_difficulty.py nonograms_data.txt nonograms_data2.txt ...
+    for filename in sys.argv[1:]:
+        data = nonograms_input_reader(filename)
+        rating = rate_puzzle(data['rows'], data['columns'])
+        print "{} {} (level {}, {} passes{})".format(
+            filename, rating['difficulty'], rating['level'], rating['passes'], ', needs search' if rating['search'] else ''
+        )
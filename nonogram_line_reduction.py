@@ -0,0 +1,86 @@
+from nonograms import empty, NonogramImpossible
+
+
+# Lots of puzzles repeat the same clue on many rows or columns (think of a border of "2,...,2" lines),
+# and what you can deduce about a line from its clue alone doesn't depend on which line it is.
+# So work it out once per distinct clue and stamp the result onto every line that shares it.
+
+def canonical_line(values, size):
+    # A clue and its mirror image give mirror image deductions, so they can share the work too.
+    # Returns the key to store the deduction under, and whether this line is the mirror of that key.
+    blocks = tuple(value for value in values if value)
+    mirror = tuple(reversed(blocks))
+    if mirror < blocks:
+        return (size, mirror), True
+    return (size, blocks), False
+
+
+def line_template(blocks, size):
+    # For a line we know nothing else about, what each position is forced to be (a block value, empty or None)
+    # and which block values could possibly reach it.
+    if not blocks:
+        return [(empty, frozenset()) for _ in xrange(size)]
+
+    slack = size - sum(blocks) - len(blocks) + 1
+    if slack < 0:
+        raise NonogramImpossible("Blocks {} can't fit in a line of {}".format(list(blocks), size))
+
+    forced = [None] * size
+    allowed = [set() for _ in xrange(size)]
+    leftmost_start = 0
+    for value in blocks:
+        # this block can start anywhere from leftmost_start to leftmost_start + slack
+        for position in xrange(leftmost_start, leftmost_start + slack + value):
+            allowed[position].add(value)
+        # and wherever it goes it must cover the overlap of its leftmost and rightmost placements
+        for position in xrange(leftmost_start + slack, leftmost_start + value):
+            forced[position] = value
+        leftmost_start += value + 1
+
+    return [
+        (empty if not allowed_here else forced_here, frozenset(allowed_here))
+        for forced_here, allowed_here in zip(forced, allowed)
+    ]
+
+
+def apply_line_template(template, tiles, direction):
+    changes_made = False
+    for (forced, allowed), tile in zip(template, tiles):
+        if forced == empty:
+            changes_made += tile.set_only_option(empty)
+        elif forced is not None:
+            changes_made += tile.set_only_option(forced, direction)
+        for value in list(tile.possible_values[direction]):
+            if value != empty and value not in allowed and value in tile.possible_values[direction]:
+                tile.remove_option(value, direction)
+                changes_made = True
+    return changes_made
+
+
+def reduce_lines(grid):
+    # Apply the clue-only deductions to every row and column of the grid.
+    # Returns a summary of how much sharing there was.
+    summary = {'lines': 0, 'distinct': 0, 'trivial': 0, 'duplicate': 0, 'mirrored': 0, 'changed': 0}
+    templates = {}
+    for direction, clues in [('row', grid.rows), ('column', grid.columns)]:
+        size = grid.size[direction]
+        for index, values in enumerate(clues):
+            summary['lines'] += 1
+            key, mirrored = canonical_line(values, size)
+            if key in templates:
+                summary['duplicate'] += 1
+            else:
+                templates[key] = line_template(key[1], size)
+                summary['distinct'] += 1
+            template = templates[key]
+            if mirrored:
+                summary['mirrored'] += 1
+                template = template[::-1]
+
+            if all(forced is not None for forced, allowed in template):
+                # no clue at all, or the blocks fill the line exactly
+                summary['trivial'] += 1
+
+            if apply_line_template(template, grid.get_line(direction, index), direction):
+                summary['changed'] += 1
+    return summary
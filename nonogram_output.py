@@ -0,0 +1,99 @@
+from base64 import b64decode, b64encode
+import json
+
+
+# Compact output for machines rather than people.
+# A solution is a bitmap: each row is packed into bytes with the first column in the most significant bit
+# (same as PBM images), rows padded to a whole number of bytes, then the lot base64 encoded.
+# Solutions are written one JSON object per line.
+
+def row_bytes(width):
+    return (width + 7) // 8
+
+
+def grid_bitmap(grid):
+    # one int per row, filled tiles are 1 bits
+    bitmap = []
+    for row in grid:
+        bits = 0
+        for tile in row:
+            bits = (bits << 1) | tile.filled
+        bitmap.append(bits)
+    return bitmap
+
+
+def encode_bitmap(bitmap, width):
+    padding = row_bytes(width) * 8 - width
+    hex_digits = row_bytes(width) * 2
+    if not hex_digits:
+        # no columns, nothing to write for any row
+        return ''
+    return b64encode(''.join(('%0*x' % (hex_digits, bits << padding)).decode('hex') for bits in bitmap))
+
+
+def decode_bitmap(encoded, width, height):
+    data = b64decode(encoded)
+    padding = row_bytes(width) * 8 - width
+    step = row_bytes(width)
+    if len(data) != step * height:
+        raise ValueError("Expected {} bytes of bitmap, got {}".format(step * height, len(data)))
+    if not step:
+        # no columns so every row is empty
+        return [0] * height
+    return [int(data[start:start + step].encode('hex'), 16) >> padding for start in xrange(0, len(data), step)]
+
+
+def solution_record(grid, **extra):
+    record = {
+        'rows': grid.size['column'],
+        'columns': grid.size['row'],
+        'bitmap': encode_bitmap(grid_bitmap(grid), grid.size['row']),
+    }
+    record.update(extra)
+    return record
+
+
+def write_solutions(grids, handle):
+    # handle can be a file or sys.stdout. Returns how many were written.
+    written = 0
+    for grid in grids:
+        handle.write(json.dumps(solution_record(grid), separators=(',', ':')) + '\n')
+        written += 1
+    return written
+
+
+def read_solutions(handle):
+    # yields the records written by write_solutions with the bitmap decoded back to one int per row.
+    # Records without a bitmap (like the worker's error records) come through as they are.
+    for line in handle:
+        if line.strip():
+            record = json.loads(line)
+            if 'bitmap' in record:
+                record['bitmap'] = decode_bitmap(record['bitmap'], record['columns'], record['rows'])
+            yield record
+
+
+def runs(line):
+    # lengths of the blocks in a string of '0' and '1'
+    return [len(run) for run in line.split('0') if run]
+
+
+def bitmap_mistakes(bitmap, rows, columns):
+    # Which lines of a solution don't match their clues. Works straight off the bits without building any tiles.
+    width = len(columns)
+    if len(bitmap) != len(rows):
+        yield 'row', len(bitmap)
+        return
+    row_strings = []
+    for index, (bits, values) in enumerate(zip(bitmap, rows)):
+        row_string = format(bits, '0{}b'.format(width))
+        if len(row_string) != width or runs(row_string) != [value for value in values if value]:
+            yield 'row', index
+        row_strings.append(row_string[-width:])
+    for index, (column_string, values) in enumerate(zip(zip(*row_strings), columns)):
+        if runs(''.join(column_string)) != [value for value in values if value]:
+            yield 'column', index
+
+
+def validate_bitmap(bitmap, rows, columns):
+    return not any(bitmap_mistakes(bitmap, rows, columns))
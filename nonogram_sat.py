@@ -0,0 +1,369 @@
+from heapq import heapify, heappop, heappush
+
+from nonograms import empty, NonogramImpossible, NonogramGaveUp
+
+
+# When the rules run out of ideas we can always fall back on brute force, but a good way to brute force is
+# to turn the grid into a SAT problem. That can go to any external solver via DIMACS, or to the small
+# CDCL solver in here so it works without anything else installed.
+
+class NonogramCNF(object):
+    # Variables 1 to rows*columns say whether each tile is filled.
+    # After those there is one variable for each place each block could start, in every row and column.
+    # Each block starts exactly once, after the end of the previous block (plus a gap),
+    # and a tile is filled exactly when some block in its row (and some block in its column) covers it.
+    def __init__(self, grid):
+        self.size = dict(grid.size)
+        self.num_vars = grid.size['row'] * grid.size['column']
+        self.clauses = []
+        self.starts = {}
+        for direction, clues in [('row', grid.rows), ('column', grid.columns)]:
+            for index, values in enumerate(clues):
+                self.encode_line(grid.get_line(direction, index), values, direction, index)
+
+    def tile_var(self, column, row):
+        return row * self.size['row'] + column + 1
+
+    def line_vars(self, direction, index):
+        if direction == 'row':
+            return [self.tile_var(position, index) for position in xrange(self.size['row'])]
+        return [self.tile_var(index, position) for position in xrange(self.size['column'])]
+
+    def new_var(self):
+        self.num_vars += 1
+        return self.num_vars
+
+    def possible_starts(self, tiles, value, direction, earliest, latest):
+        for start in xrange(earliest, latest + 1):
+            if start > 0 and tiles[start - 1].filled:
+                continue
+            if start + value < len(tiles) and tiles[start + value].filled:
+                continue
+            if all(value in tile.possible_values[direction] for tile in tiles[start:start + value]):
+                yield start
+
+    def encode_line(self, tiles, values, direction, index):
+        cells = self.line_vars(direction, index)
+        for tile, cell in zip(tiles, cells):
+            # whatever we already know goes in as unit clauses
+            if tile.filled:
+                self.clauses.append([cell])
+            elif any(tile.decided.itervalues()):
+                self.clauses.append([-cell])
+
+        blocks = [value for value in values if value]
+        slack = len(tiles) - sum(blocks) - len(blocks) + 1
+        if slack < 0:
+            raise NonogramImpossible("{} {} can't fit {}".format(direction, index, values))
+
+        covering = [[] for _ in tiles]
+        line_starts = []
+        earliest = 0
+        for value in blocks:
+            block_starts = {}
+            for start in self.possible_starts(tiles, value, direction, earliest, earliest + slack):
+                block_starts[start] = var = self.new_var()
+                for position in xrange(start, start + value):
+                    self.clauses.append([-var, cells[position]])
+                    covering[position].append(var)
+            if not block_starts:
+                raise NonogramImpossible("Nowhere to put the {} block in {} {}".format(value, direction, index))
+            line_starts.append((value, block_starts))
+            earliest += value + 1
+
+        for block, (value, block_starts) in enumerate(line_starts):
+            # exactly one start for each block
+            start_vars = sorted(block_starts.itervalues())
+            self.clauses.append(start_vars)
+            for i, var in enumerate(start_vars):
+                for other_var in start_vars[i + 1:]:
+                    self.clauses.append([-var, -other_var])
+            if block + 1 < len(line_starts):
+                # the next block has to start at least one tile after this one finishes
+                next_starts = line_starts[block + 1][1]
+                for start, var in block_starts.iteritems():
+                    self.clauses.append([-var] + [
+                        next_var for next_start, next_var in next_starts.iteritems() if next_start > start + value
+                    ])
+
+        for cell, cell_covering in zip(cells, covering):
+            self.clauses.append([-cell] + cell_covering)
+
+        self.starts[(direction, index)] = line_starts
+
+    def write_dimacs(self, handle):
+        handle.write('c nonogram {} rows {} columns\n'.format(self.size['column'], self.size['row']))
+        handle.write('p cnf {} {}\n'.format(self.num_vars, len(self.clauses)))
+        for clause in self.clauses:
+            handle.write(' '.join(str(literal) for literal in clause) + ' 0\n')
+
+    def apply_model(self, grid, model):
+        # model maps variable -> True/False, e.g. from CDCLSolver.solve or read_dimacs_model
+        for (direction, index), line_starts in self.starts.iteritems():
+            tiles = grid.get_line(direction, index)
+            for value, block_starts in line_starts:
+                for start, var in block_starts.iteritems():
+                    if model.get(var):
+                        for tile in tiles[start:start + value]:
+                            tile.set_only_option(value, direction)
+        for row in grid:
+            for tile in row:
+                if not model.get(self.tile_var(tile.column, tile.row)):
+                    tile.set_only_option(empty)
+
+
+def read_dimacs_model(lines):
+    # Understands the usual SAT competition output ("s SATISFIABLE" then "v 1 -2 3 ... 0" lines)
+    # as well as a bare list of literals.
+    model = {}
+    for line in lines:
+        parts = line.split()
+        if not parts or parts[0] == 'c':
+            continue
+        if parts[0] == 's':
+            if parts[1] == 'UNSATISFIABLE':
+                raise NonogramImpossible("External solver says there is no solution")
+            if parts[1] != 'SATISFIABLE':
+                raise NonogramGaveUp("External solver says {}".format(' '.join(parts[1:])))
+            continue
+        if parts[0] == 'v':
+            parts = parts[1:]
+        for literal in map(int, parts):
+            if literal:
+                model[abs(literal)] = literal > 0
+    return model
+
+
+def watch_index(literal):
+    return 2 * abs(literal) + (literal < 0)
+
+
+def luby(index):
+    # 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ...
+    size, power = 1, 0
+    while size < index + 1:
+        power += 1
+        size = 2 * size + 1
+    while size - 1 != index:
+        size = (size - 1) >> 1
+        power -= 1
+        index %= size
+    return 2 ** power
+
+
+class CDCLSolver(object):
+    # Conflict driven clause learning with two watched literals, first-UIP learning,
+    # activity based branching with phase saving, and Luby restarts.
+    restart_unit = 100
+    activity_decay = 0.95
+
+    def __init__(self, num_vars, clauses):
+        self.num_vars = num_vars
+        self.watches = [[] for _ in xrange(2 * num_vars + 2)]
+        self.values = [None] * (num_vars + 1)
+        self.levels = [0] * (num_vars + 1)
+        self.reasons = [None] * (num_vars + 1)
+        self.phases = [False] * (num_vars + 1)
+        self.activity = [0.0] * (num_vars + 1)
+        self.bump = 1.0
+        self.heap = [(0.0, var) for var in xrange(1, num_vars + 1)]
+        self.trail = []
+        self.trail_limits = []
+        self.queue_head = 0
+        self.unsatisfiable = False
+        self.stats = {'decisions': 0, 'conflicts': 0, 'propagations': 0, 'learnt': 0, 'restarts': 0}
+        for clause in clauses:
+            self.add_clause(clause)
+
+    def value_of(self, literal):
+        value = self.values[abs(literal)]
+        if value is None:
+            return None
+        return value == (literal > 0)
+
+    def add_clause(self, clause):
+        if self.unsatisfiable:
+            return
+        clause = list(set(clause))
+        if any(-literal in clause for literal in clause):
+            return
+        if any(self.value_of(literal) for literal in clause):
+            return
+        clause = [literal for literal in clause if self.value_of(literal) is None]
+        if not clause:
+            self.unsatisfiable = True
+        elif len(clause) == 1:
+            self.enqueue(clause[0], None)
+            if self.propagate() is not None:
+                self.unsatisfiable = True
+        else:
+            self.attach(clause)
+
+    def attach(self, clause):
+        self.watches[watch_index(clause[0])].append(clause)
+        self.watches[watch_index(clause[1])].append(clause)
+
+    def enqueue(self, literal, reason):
+        var = abs(literal)
+        self.values[var] = literal > 0
+        self.levels[var] = len(self.trail_limits)
+        self.reasons[var] = reason
+        self.trail.append(literal)
+
+    def propagate(self):
+        # returns a conflicting clause, or None once everything implied has been assigned
+        while self.queue_head < len(self.trail):
+            false_literal = -self.trail[self.queue_head]
+            self.queue_head += 1
+            self.stats['propagations'] += 1
+            watching = self.watches[watch_index(false_literal)]
+            kept = []
+            position = 0
+            while position < len(watching):
+                clause = watching[position]
+                position += 1
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], clause[0]
+                if self.value_of(clause[0]):
+                    kept.append(clause)
+                    continue
+                for other in xrange(2, len(clause)):
+                    if self.value_of(clause[other]) is not False:
+                        clause[1], clause[other] = clause[other], clause[1]
+                        self.watches[watch_index(clause[1])].append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if self.value_of(clause[0]) is False:
+                        kept.extend(watching[position:])
+                        self.watches[watch_index(false_literal)] = kept
+                        return clause
+                    self.enqueue(clause[0], clause)
+            self.watches[watch_index(false_literal)] = kept
+        return None
+
+    def bump_activity(self, var):
+        self.activity[var] += self.bump
+        if self.activity[var] > 1e100:
+            self.activity = [activity * 1e-100 for activity in self.activity]
+            self.bump *= 1e-100
+            self.heap = [
+                (-self.activity[other], other)
+                for other in xrange(1, self.num_vars + 1) if self.values[other] is None
+            ]
+            heapify(self.heap)
+        else:
+            heappush(self.heap, (-self.activity[var], var))
+
+    def analyze(self, conflict):
+        # walk back up the trail from the conflict until only one literal from the current level is left
+        level = len(self.trail_limits)
+        learnt = [None]
+        seen = set()
+        at_this_level = 0
+        literal = None
+        clause = conflict
+        position = len(self.trail) - 1
+        while True:
+            for other in clause:
+                var = abs(other)
+                if other == literal or var in seen or self.levels[var] == 0:
+                    continue
+                seen.add(var)
+                self.bump_activity(var)
+                if self.levels[var] == level:
+                    at_this_level += 1
+                else:
+                    learnt.append(other)
+            while abs(self.trail[position]) not in seen:
+                position -= 1
+            literal = self.trail[position]
+            position -= 1
+            at_this_level -= 1
+            if not at_this_level:
+                break
+            clause = self.reasons[abs(literal)]
+        learnt[0] = -literal
+
+        backjump_level = 0
+        if len(learnt) > 1:
+            # watch the literal that will be unassigned last
+            deepest = max(xrange(1, len(learnt)), key=lambda i: self.levels[abs(learnt[i])])
+            learnt[1], learnt[deepest] = learnt[deepest], learnt[1]
+            backjump_level = self.levels[abs(learnt[1])]
+        return learnt, backjump_level
+
+    def backtrack(self, level):
+        if len(self.trail_limits) <= level:
+            return
+        limit = self.trail_limits[level]
+        for literal in self.trail[limit:]:
+            var = abs(literal)
+            self.phases[var] = literal > 0
+            self.values[var] = None
+            self.reasons[var] = None
+            heappush(self.heap, (-self.activity[var], var))
+        del self.trail[limit:]
+        del self.trail_limits[level:]
+        self.queue_head = len(self.trail)
+
+    def pick_branch_var(self):
+        while self.heap:
+            negative_activity, var = heappop(self.heap)
+            if self.values[var] is None and -negative_activity == self.activity[var]:
+                return var
+        return None
+
+    def solve(self, max_conflicts=None):
+        # Returns a model mapping every variable to True/False, or None if there isn't one.
+        # Raises NonogramGaveUp if max_conflicts runs out first.
+        if self.unsatisfiable or self.propagate() is not None:
+            return None
+        restarts = 0
+        conflicts_until_restart = self.restart_unit * luby(restarts)
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.stats['conflicts'] += 1
+                if not self.trail_limits:
+                    return None
+                if max_conflicts is not None and self.stats['conflicts'] > max_conflicts:
+                    raise NonogramGaveUp("Gave up after {} conflicts".format(max_conflicts))
+                learnt, backjump_level = self.analyze(conflict)
+                self.backtrack(backjump_level)
+                if len(learnt) == 1:
+                    self.enqueue(learnt[0], None)
+                else:
+                    self.attach(learnt)
+                    self.enqueue(learnt[0], learnt)
+                self.stats['learnt'] += 1
+                self.bump /= self.activity_decay
+                conflicts_until_restart -= 1
+                continue
+
+            if conflicts_until_restart <= 0:
+                restarts += 1
+                self.stats['restarts'] += 1
+                conflicts_until_restart = self.restart_unit * luby(restarts)
+                self.backtrack(0)
+
+            var = self.pick_branch_var()
+            if var is None:
+                return {var: self.values[var] for var in xrange(1, self.num_vars + 1)}
+            self.stats['decisions'] += 1
+            self.trail_limits.append(len(self.trail))
+            self.enqueue(var if self.phases[var] else -var, None)
+
+
+def solve_with_sat(grid, max_conflicts=None):
+    # Finish off the grid from whatever is already known about it. Returns the solver stats.
+    cnf = NonogramCNF(grid)
+    solver = CDCLSolver(cnf.num_vars, cnf.clauses)
+    model = solver.solve(max_conflicts)
+    if model is None:
+        raise NonogramImpossible("No way to finish this grid from what we already know")
+    cnf.apply_model(grid, model)
+    stats = dict(solver.stats)
+    stats['variables'] = cnf.num_vars
+    stats['clauses'] = len(cnf.clauses)
+    return stats
@@ -1,16 +1,18 @@
 from collections import defaultdict
 import itertools
 
-from nonograms import NonogramGrid, empty, empty_tile, NonogramImpossible
+from nonograms import NonogramGrid, empty, empty_tile, NonogramImpossible, block_length, needs_separator
+from nonogram_line_reduction import reduce_lines
 
 
 def generate_blocks(values, empty_at_start=0, separator=empty):
     for empty_tile in xrange(empty_at_start):
         yield empty
-    for value in values:
-        for item in xrange(value):
+    for value, next_value in zip(values, values[1:] + [None]):
+        for item in xrange(block_length(value)):
             yield value
-        yield separator
+        if needs_separator(value, next_value):
+            yield separator
 
 
 def normal(whatever):
@@ -29,9 +31,30 @@ def try_every_row_and_column(rule_function):
             if not self.completed('column', index) and rule_function(self, index, column, 'column'):
                 return "column {}".format(index)
         return False
+    # keep the single line version around for the pipeline which visits one line at a time
+    rule_function_try_every.line_rule = rule_function
     return rule_function_try_every
 
 
+# decorator for functions summarising a line of tiles, e.g. how many tiles are known empty at each end.
+# In pipeline mode a summary of a whole line is remembered until any tile in that line changes,
+# so all the rules looking at the line can share it. Summaries are tuples so no rule can change the shared copy.
+def line_summary(summary_function):
+    def cached_summary_function(self, tiles, *args):
+        line = self.line_ids.get(id(tiles))
+        if self.summary_cache is None or line is None:
+            # not pipelining, or only part of a line
+            return summary_function(self, tiles, *args)
+        direction, index = line
+        version = self.line_versions[direction][index]
+        key = (summary_function.__name__, direction, index) + args
+        cached = self.summary_cache.get(key)
+        if cached is None or cached[0] != version:
+            cached = self.summary_cache[key] = (version, summary_function(self, tiles, *args))
+        return cached[1]
+    return cached_summary_function
+
+
 class NonogramSolver(NonogramGrid):
     rules = [
         'fill_fully_entire_line', 'fill_middle', 'cross_out_too_far_from_any_block',
@@ -42,13 +65,58 @@ class NonogramSolver(NonogramGrid):
         'fill_from_edge', 'too_far_from_known_block_repeated_values', 'eliminate_wrong_side'
     ]
 
+    def __init__(self, row_values, column_values, preprocess=True, pipeline=False, initial_state=None):
+        super(NonogramSolver, self).__init__(row_values, column_values, initial_state)
+        # In pipeline mode each pass visits a line once and runs every rule on it,
+        # sharing line summaries between the rules (see line_summary).
+        self.pipeline = pipeline
+        self.summary_cache = {} if pipeline else None
+        self.line_ids = {
+            id(self.get_line(direction, index)): (direction, index)
+            for direction, clues in [('row', self.rows), ('column', self.columns)] for index in xrange(len(clues))
+        }
+        # Deduce what we can from each distinct clue (sharing the work between duplicate and mirrored lines)
+        # before any of the rules run. Turn off to see the rules do it all from scratch.
+        self.line_reduction = reduce_lines(self) if preprocess else None
+
     def try_all_rules(self):
+        if self.pipeline:
+            return self.try_all_rules_on_each_line()
         for rule in self.rules:
             outcome = getattr(self, rule)()
             if outcome:
                 return "We made progress using the '{}' rule ({}):".format(rule, outcome)
         return False
 
+    def try_all_rules_on_each_line(self):
+        progress = []
+        for direction, clues in [('row', self.rows), ('column', self.columns)]:
+            for index, values in enumerate(clues):
+                for rule in self.rules:
+                    if self.completed(direction, index):
+                        break
+                    if getattr(self, rule).line_rule(self, index, values, direction):
+                        progress.append("'{}' rule ({} {})".format(rule, direction, index))
+        if progress:
+            return "We made progress using the {}:".format(', '.join(progress))
+        return False
+
+    def solve(self, fall_back_to_sat=True):
+        # Apply rules until they stop making progress. If that doesn't finish the grid,
+        # hand what we know over to the SAT solver, which always gets there. Returns its stats if it was needed.
+        # The rules can fill in a grid whose clues contradict each other, so a finished grid is checked against them.
+        while self.try_all_rules():
+            pass
+        sat_stats = None
+        if fall_back_to_sat and not self.all_completed():
+            from nonogram_sat import solve_with_sat
+            sat_stats = solve_with_sat(self)
+        if self.all_completed():
+            from nonogram_output import grid_bitmap, bitmap_mistakes
+            for direction, index in bitmap_mistakes(grid_bitmap(self), self.rows, self.columns):
+                raise NonogramImpossible("The finished grid doesn't match the clue for {} {}".format(direction, index))
+        return sat_stats
+
     # if the values for one row + the number of values - 1 is equal to the length of the row,
     # you can fill it in fully. crossed out positions at either end can be subtracted from target sum.
     @try_every_row_and_column
@@ -204,6 +272,7 @@ class NonogramSolver(NonogramGrid):
             return True
         return False
 
+    @line_summary
     def get_empty_count_at_ends(self, tiles, direction):
         empty_at_start = 0
         while empty_at_start < len(tiles) and tiles[empty_at_start].decided[direction] and not tiles[empty_at_start].filled:
@@ -262,6 +331,7 @@ class NonogramSolver(NonogramGrid):
                         tile.remove_option(value, direction)
         return changes_made
 
+    @line_summary
     def get_contiguous_lengths(self, tiles):
         length_contiguous_blocks = []
         current_contiguous_length = 0
@@ -280,7 +350,7 @@ class NonogramSolver(NonogramGrid):
                 "You lost some values there this function is dodgy {}, {}"
                 .format(length_contiguous_blocks, "".join([str(tile) for tile in tiles]))
             )
-        return length_contiguous_blocks
+        return tuple(length_contiguous_blocks)
 
     @try_every_row_and_column
     def rule_out_values_based_on_already_used_up(self, index, values, direction):
@@ -289,18 +359,14 @@ class NonogramSolver(NonogramGrid):
         return self.rule_out_values_based_on_already_used_up_partial(index, values, direction, tiles)
 
     def rule_out_values_based_on_already_used_up_partial(self, index, values, direction, tiles):
-        observed_counts = defaultdict(int)
-
-        for tile in tiles:
-            if tile.decided[direction]:
-                observed_counts[tile.possible_values[direction][0]] += 1
+        observed_counts = self.get_decided_counts(tiles, direction)
 
         max_allowed_counts = defaultdict(int)
         for value in values:
             # this looks a bit funky but it's because we might have two 4 groups therefore need 8 "4" tiles
             max_allowed_counts[value] += value
 
-        used_up = [key for key, value in observed_counts.iteritems() if value == max_allowed_counts[key]]
+        used_up = [key for key, value in observed_counts if value == max_allowed_counts[key]]
         if not used_up:
             return False
 
@@ -399,8 +465,28 @@ class NonogramSolver(NonogramGrid):
                 tile_might_change.remove_option(value, direction)
         return changes_made
 
+    @line_summary
+    def get_decided_counts(self, tiles, direction):
+        observed_counts = defaultdict(int)
+        for tile in tiles:
+            if tile.decided[direction]:
+                observed_counts[tile.possible_values[direction][0]] += 1
+        return tuple(observed_counts.iteritems())
+
+    @line_summary
+    def get_decided_positions(self, tiles, direction):
+        # where the filled tiles we know the value of are, by value
+        known_by_value = defaultdict(list)
+        for position, tile in enumerate(tiles):
+            if tile.filled and tile.decided[direction]:
+                known_by_value[tile.possible_values[direction][0]].append(position)
+        return tuple((value, tuple(positions)) for value, positions in known_by_value.iteritems())
+
     def get_known_blocks(self, index, values, direction):
-        tiles = self.get_line(direction, index)
+        return self.get_known_blocks_in_line(self.get_line(direction, index), direction)
+
+    @line_summary
+    def get_known_blocks_in_line(self, tiles, direction):
         last_tile_filled = False
         value_this_block = 'unknown'
         blocks = []
@@ -419,7 +505,7 @@ class NonogramSolver(NonogramGrid):
                     blocks.append((start_contiguous, length_contiguous, value_this_block))
                     value_this_block = 'unknown'
                 last_tile_filled = False
-        return blocks
+        return tuple(blocks)
 
     @try_every_row_and_column
     def block_long_enough(self, index, values, direction):
@@ -466,11 +552,7 @@ class NonogramSolver(NonogramGrid):
     def too_far_from_known_block_repeated_values(self, index, values, direction):
         tiles = self.get_line(direction, index)
         changes_made = False
-        known_by_value = defaultdict(list)
-
-        for position, tile in enumerate(tiles):
-            if tile.filled and tile.decided[direction]:
-                known_by_value[tile.possible_values[direction][0]].append(position)
+        known_by_value = dict(self.get_decided_positions(tiles, direction))
 
         for value in set(values):
             if values.count(value) == 1:
@@ -481,8 +563,7 @@ class NonogramSolver(NonogramGrid):
                 pass
             else:
                 # appears exactly twice
-                relevant_positions = known_by_value[value]
-                relevant_positions.sort()
+                relevant_positions = known_by_value.get(value, ())
                 if len(relevant_positions) < 2:
                     continue
                 lowest = relevant_positions[0]
@@ -510,10 +591,6 @@ class NonogramSolver(NonogramGrid):
                     in_left.sort()
                     in_right.sort()
 
-                    if direction == 'row' and index == 13:
-                        print in_left
-                        print in_right
-
                     for positions in [in_left, in_right]:
                         if len(positions) > value:
                             raise Exception("some fishy logic going on here")
@@ -551,15 +628,10 @@ class NonogramSolver(NonogramGrid):
         changes_made = False
         unique_values = set(values)
 
-        fixed_points_by_value = defaultdict(list)
-
-        for position, tile in enumerate(tiles):
-            if tile.filled and tile.decided[direction]:
-                # Then we have a fixed point to use
-                fixed_points_by_value[tile.possible_values[direction][0]].append(position)
+        # filled tiles we know the value of are fixed points to use
+        fixed_points_by_value = self.get_decided_positions(tiles, direction)
 
-        for value, fixed_points in fixed_points_by_value.iteritems():
-            fixed_points.sort()
+        for value, fixed_points in fixed_points_by_value:
             first_appearance = values.index(value)
             # why is there no rindex !?
             last_appearance = first_appearance
@@ -3,9 +3,18 @@ from pprint import pprint
 from collections import defaultdict
 
 from nonograms import nonograms_input_reader, empty
+from nonogram_solver import NonogramSolver
 from tally_nonogram_rules import tally_nonogram_rules_used
 
 local_folder = os.path.dirname(os.path.realpath(__file__))
+
+# nonograms_data7.txt isn't square, which has caught out mixing up row and column counts before
+rectangle = nonograms_input_reader(os.path.join(local_folder, "nonograms_data7.txt"))
+for options in [{}, {'pipeline': True}, {'preprocess': False}]:
+    solver = NonogramSolver(rectangle['rows'], rectangle['columns'], **options)
+    solver.solve()
+    assert solver.all_completed(), options
+
 data = nonograms_input_reader(os.path.join(local_folder, "nonograms_data6.txt"))
 rows_sum = sum((sum(row) for row in data['rows']))
 columns_sum = sum((sum(column) for column in data['columns']))
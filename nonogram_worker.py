@@ -0,0 +1,44 @@
+import json
+import sys
+
+
+# Long lived worker: reads one puzzle per line from stdin as JSON ({"rows": [...], "columns": [...]},
+# plus an optional "id" and an optional partly solved "grid" to carry on from)
+# and writes one solution per line to stdout in the nonogram_output format.
+# Keep it running and feed it puzzles so small ones only cost the solve, not starting Python.
+# Nothing beyond the standard library gets imported until the first puzzle turns up.
+
+def solve_puzzle(puzzle):
+    from nonograms import NonogramImpossible
+    from nonogram_solver import NonogramSolver
+    from nonogram_output import solution_record, grid_bitmap, validate_bitmap
+
+    solver = NonogramSolver(puzzle['rows'], puzzle['columns'], pipeline=True, initial_state=puzzle.get('grid'))
+    sat_stats = solver.solve()
+    # every tile being decided isn't enough, the grid has to match the clues
+    if not validate_bitmap(grid_bitmap(solver), puzzle['rows'], puzzle['columns']):
+        raise NonogramImpossible("The solution doesn't match the clues")
+    record = solution_record(solver, solved=True)
+    if sat_stats:
+        record['sat'] = sat_stats
+    return record
+
+
+def run(input_handle, output_handle):
+    for line in input_handle:
+        if not line.strip():
+            continue
+        puzzle = {}
+        try:
+            puzzle = json.loads(line)
+            record = solve_puzzle(puzzle)
+        except Exception as error:
+            record = {'error': '{}: {}'.format(type(error).__name__, error)}
+        if 'id' in puzzle:
+            record['id'] = puzzle['id']
+        output_handle.write(json.dumps(record, separators=(',', ':')) + '\n')
+        output_handle.flush()
+
+
+if __name__ == '__main__':
+    run(iter(sys.stdin.readline, ''), sys.stdout)
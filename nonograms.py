@@ -10,8 +10,13 @@ class NonogramBadRequest(Exception):
     pass
 
 
+class NonogramGaveUp(Exception):
+    # ran out of effort before finding out either way, which isn't the same as impossible
+    pass
+
+
 class NonogramGrid(list):
-    def __init__(self, row_values, column_values):
+    def __init__(self, row_values, column_values, initial_state=None):
         super(NonogramGrid, self).__init__()
         self.columns = column_values
         self.rows = row_values
@@ -26,12 +31,61 @@ class NonogramGrid(list):
         # self[x][y] is the yth element of xth row i.e. y is horizontal component
         # but I want to access them by name because I always get confused otherwise
 
+        # tiles never get replaced so the columns can be built once
+        self.column_lines = [[row[horiz] for row in self] for horiz in xrange(self.size['row'])]
+        # every time a tile changes it bumps the version of its row and its column
+        self.line_versions = {'row': [0] * self.size['column'], 'column': [0] * self.size['row']}
+        for row in self:
+            for tile in row:
+                tile.line_versions = self.line_versions
+        if initial_state:
+            self.seed_state(initial_state)
+
     def enforce_inputs(self):
+        if is_coloured({'rows': self.rows, 'columns': self.columns}):
+            raise NonogramBadRequest("coloured puzzles need ColourNonogramGrid")
         assert isinstance(self.rows, list)
         assert isinstance(self.columns, list)
         assert all(isinstance(row, list) for row in self.rows)
         assert all(isinstance(column, list) for column in self.columns)
 
+    def seed_state(self, state):
+        # Carry on from a partly solved grid: one string per row using the characters convert_to_string gives
+        # i.e. '0' (or u'█') filled, 'x' empty, '.' unknown. Spaces are ignored.
+        state = [[char for char in row if char != ' '] for row in state]
+        if len(state) != self.size['column'] or any(len(row) != self.size['row'] for row in state):
+            raise NonogramBadRequest(
+                "Initial state should be {} rows of {} tiles".format(self.size['column'], self.size['row'])
+            )
+        for row in state:
+            for char in row:
+                if char not in filled_chars and char not in ('x', '.'):
+                    raise NonogramBadRequest("Don't know what '{}' means in an initial state".format(char))
+
+        for index, values in enumerate(self.rows):
+            check_partial_line(values, state[index], 'row', index)
+        for index, values in enumerate(self.columns):
+            check_partial_line(values, [row[index] for row in state], 'column', index)
+
+        # It all makes sense so write it straight into the tiles
+        for row, row_state in zip(self, state):
+            for tile, char in zip(row, row_state):
+                if char in filled_chars:
+                    for values in tile.possible_values.itervalues():
+                        if empty in values:
+                            values.remove(empty)
+                    tile.filled = True
+                elif char == 'x':
+                    tile.possible_values = {direction: [empty] for direction in tile.possible_values}
+                else:
+                    continue
+                tile.note_change()
+                tile.check_if_decided()
+
+    def current_state(self):
+        # the opposite of seed_state
+        return [''.join(str(tile) for tile in row) for row in self]
+
     def get_value(self, column, row):
         return self[row][column]
 
@@ -43,7 +97,7 @@ class NonogramGrid(list):
             yield row
 
     def get_column(self, horiz):
-        return [row[horiz] for row in self]
+        return self.column_lines[horiz]
 
     def get_columns(self):
         for column in xrange(len(self[0])):
@@ -89,7 +143,33 @@ class NonogramGrid(list):
             current_tiles = self.get_column(index)
         return all((tile.decided[direction] for tile in current_tiles))
 
+    def all_completed(self):
+        return all(self.completed('row', index) for index in xrange(self.size['column']))
+
 empty = 'x'
+filled_chars = ('0', u'█')
+
+
+def check_partial_line(values, chars, direction, index):
+    # Could this line of '0'/'x'/'.' characters still turn out to match its clue?
+    # fits[j][i] says whether the first j blocks can be placed in chars[:i] without contradicting it.
+    blocks = [value for value in values if value]
+    filled = [char in filled_chars for char in chars]
+    size = len(chars)
+    fits = [[False] * (size + 1) for _ in xrange(len(blocks) + 1)]
+    fits[0][0] = True
+    for i in xrange(1, size + 1):
+        fits[0][i] = fits[0][i - 1] and not filled[i - 1]
+    for j, value in enumerate(blocks, 1):
+        for i in xrange(value, size + 1):
+            start = i - value
+            # either this tile is empty and the blocks fit before it, or block j ends here
+            ends_here = 'x' not in chars[start:i] and (
+                fits[j - 1][0] if start == 0 else not filled[start - 1] and fits[j - 1][start - 1]
+            )
+            fits[j][i] = (fits[j][i - 1] and not filled[i - 1]) or ends_here
+    if not fits[len(blocks)][size]:
+        raise NonogramImpossible("{} {} can't match {}".format(direction, index, values))
 
 
 class NonogramTile(object):
@@ -107,6 +187,7 @@ class NonogramTile(object):
         # tracks if we know what block this tile is part of or know it's definitely not filled
         self.decided = {direction: False for direction in self.possible_values}
         self.filled = False  # tracks if this tile is definitely filled (might not know what block it's part of)
+        self.line_versions = None  # the grid's, so anything summarising a line can tell when it's out of date
         #print "creating: {}".format(repr(self))
 
     def check_if_decided(self):
@@ -147,6 +228,7 @@ class NonogramTile(object):
                 "Can't work out what to do with these inputs '{}' '{}' in tile {}"
                 .format(value, direction, repr(self))
             )
+        self.note_change()
         self.check_if_decided()
 
     def set_only_option(self, value, direction=None):
@@ -179,7 +261,15 @@ class NonogramTile(object):
         self.filled = (value != empty)
         self.check_if_decided()
         # return whether anything has changed
-        return repr(self) != start_state
+        changed = repr(self) != start_state
+        if changed:
+            self.note_change()
+        return changed
+
+    def note_change(self):
+        if self.line_versions:
+            self.line_versions['row'][self.row] += 1
+            self.line_versions['column'][self.column] += 1
 
     def __repr__(self):
         return (
@@ -206,6 +296,38 @@ class NonogramTile(object):
         return self.convert_to_string(u'█', show_filled_values)
 
 
+# Blocks in coloured puzzles are written as the length followed by the colour e.g. 3r or 3red,
+# and read in as (length, colour). Plain numbers are blocks of the one and only colour.
+def parse_block(value):
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    length = value.rstrip('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+    if not length.isdigit():
+        raise NonogramBadRequest("Can't make sense of block '{}'".format(value))
+    return int(length), value[len(length):]
+
+
+def block_length(value):
+    return value[0] if isinstance(value, tuple) else value
+
+
+def block_colour(value):
+    return value[1] if isinstance(value, tuple) else None
+
+
+def needs_separator(value, next_value):
+    # blocks of different colours can touch, blocks of the same colour need a gap
+    return next_value is None or block_colour(value) == block_colour(next_value)
+
+
+def is_coloured(inputs):
+    # blocks from JSON come through as lists rather than tuples
+    return any(
+        isinstance(value, (tuple, list)) for values in inputs['rows'] + inputs['columns'] for value in values
+    )
+
+
 def nonograms_input_reader(filename):
     with open(filename) as handler:
         lines = handler.readlines()
@@ -214,8 +336,16 @@ def nonograms_input_reader(filename):
         line = line.strip()
         if line in inputs:
             next_input = line
+        elif line == 'grid':
+            # optional partly solved state to carry on from, see NonogramGrid.seed_state
+            next_input = line
+            inputs['grid'] = []
+        elif next_input == 'grid':
+            if line:
+                # rows copied from unicode(grid) start with the clue, so only keep what's after the ' |'
+                inputs['grid'].append(line.decode('utf8').split('|')[-1])
         else:
-            inputs[next_input].append([int(value) for value in line.split(',')])
+            inputs[next_input].append([parse_block(value) for value in line.split(',')])
     return inputs
 
 empty_tile = NonogramTile(0, 0, [], [])
@@ -6,7 +6,8 @@ def tally_nonogram_rules_used(rows, columns, tally=None):
     if not tally:
         tally = defaultdict(int)
 
-    solver = NonogramSolver(rows, columns)
+    # no clue-only preprocessing, the rules should get the credit for all of the work
+    solver = NonogramSolver(rows, columns, preprocess=False)
     print unicode(solver)
     while True:
         shuffle(solver.rules)